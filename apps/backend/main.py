@@ -1,23 +1,28 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pathlib import Path
 import json
 import shutil
 import os
 from typing import List, Dict, Union, Optional
-import requests
 import base64
 import time
+import uuid
 import asyncio
 import platform
+import sqlite3
+import tarfile
+import threading
+import zipfile
+from contextlib import asynccontextmanager, contextmanager
 from pydantic import BaseModel
 
 # Windows環境でasyncioのイベントループポリシーを設定
 if platform.system() == "Windows":
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-# parse_metadata.pyからextract_metadata関数を直接インポート
+# parse_metadata.pyからextract_metadata関数を利用する
 # プロジェクトルートからの相対パスでインポート
 import importlib.util
 import sys
@@ -27,14 +32,23 @@ project_root = Path(__file__).parent.parent.parent
 scripts_dir = project_root / "scripts"
 parse_metadata_path = scripts_dir / "parse_metadata.py"
 
-# モジュールを動的にインポート
-spec = importlib.util.spec_from_file_location("parse_metadata", parse_metadata_path)
-parse_metadata = importlib.util.module_from_spec(spec)
-sys.modules["parse_metadata"] = parse_metadata
-spec.loader.exec_module(parse_metadata)
+# PillowやpiexifはPNG読み込み時まで不要なため、起動を速くするために初回呼び出し時まで読み込みを遅延する
+_parse_metadata = None
+_parse_metadata_lock = threading.Lock()
 
-# extract_metadata関数を直接参照
-extract_metadata = parse_metadata.extract_metadata
+def extract_metadata(image_path: Path) -> Dict:
+    """parse_metadata.extract_metadataを呼び出す（モジュールは初回呼び出し時に読み込む）"""
+    global _parse_metadata
+    if _parse_metadata is None:
+        with _parse_metadata_lock:
+            if _parse_metadata is None:
+                # モジュールを動的にインポート
+                spec = importlib.util.spec_from_file_location("parse_metadata", parse_metadata_path)
+                module = importlib.util.module_from_spec(spec)
+                sys.modules["parse_metadata"] = module
+                spec.loader.exec_module(module)
+                _parse_metadata = module
+    return _parse_metadata.extract_metadata(image_path)
 
 # モデル関連の型定義
 class Model(BaseModel):
@@ -58,8 +72,16 @@ class GenerateImageRequest(BaseModel):
     seed: int = -1
     model_id: Optional[str] = None
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動時にカタログのウォームアップをバックグラウンドで開始し、終了時に打ち切る"""
+    # リクエストの受け付けを妨げないよう、ウォームアップはスレッドプールで実行する
+    asyncio.get_running_loop().run_in_executor(None, warm_up_catalog)
+    yield
+    catalog_warmup_stop.set()
+
 # FastAPIアプリケーションの初期化
-app = FastAPI(title="Sikority API")
+app = FastAPI(title="Sikority API", lifespan=lifespan)
 
 # CORSの設定
 app.add_middleware(
@@ -74,23 +96,186 @@ app.add_middleware(
 current_dir = Path(__file__).parent
 project_root = current_dir.parent.parent
 config_file_path = project_root / "config" / "default.json"
+# 複数ワーカー間で共有するロックファイルとカタログDBのパス
+lock_dir = project_root / "config" / ".locks"
+catalog_db_path = project_root / "config" / "catalog.sqlite3"
 config = {}
+# 最後に読み込んだ設定ファイルの更新時刻（他ワーカーによる変更検知用）
+_config_mtime_ns: Optional[int] = None
+_thread_locks: Dict[str, threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+
+@contextmanager
+def file_lock(name: str):
+    """プロセス間で共有される排他ロックを取得する（同一プロセス内のスレッド間も排他）"""
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(name, threading.Lock())
+    with thread_lock:
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        with open(lock_dir / f"{name}.lock", "a+b") as f:
+            if platform.system() == "Windows":
+                import msvcrt
+                f.seek(0)
+                # LK_LOCKは約10秒で諦めるため、取得できるまで待機する
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.05)
+                try:
+                    yield
+                finally:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def read_config_file() -> Dict:
+    """設定ファイルを読み込んで新しい辞書として返す（グローバル設定は変更しない）"""
+    with open(config_file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _install_config(data: Dict, mtime_ns: int):
+    global config, _config_mtime_ns
+    # 読み込み中の他スレッドが空の設定を見ないよう、辞書ごと差し替える
+    config = data
+    _config_mtime_ns = mtime_ns
 
 def load_config():
-    global config
     with open(config_file_path, "r", encoding="utf-8") as f:
-        config.clear()
-        config.update(json.load(f))
+        mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        data = json.load(f)
+    _install_config(data, mtime_ns)
+
+def get_config() -> Dict:
+    """設定を取得する。初回呼び出し時、または他のワーカーが設定ファイルを更新していれば読み込む"""
+    try:
+        mtime_ns = config_file_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return config
+    if mtime_ns != _config_mtime_ns:
+        load_config()
+    return config
+
+def save_config(data: Dict):
+    """設定を書き込み、このワーカーの設定として反映する（file_lock("config")を保持して呼び出すこと）"""
+    # 一時ファイルに書き出してから置き換え、他ワーカーが書きかけのJSONを読まないようにする
+    tmp_path = config_file_path.with_name(f"{config_file_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, config_file_path)
+    _install_config(data, config_file_path.stat().st_mtime_ns)
+
+# SQLiteの1クエリあたりのプレースホルダ数の上限（古いSQLiteの既定値999）を超えないように分割する
+CATALOG_QUERY_BATCH_SIZE = 900
+_catalog_local = threading.local()
+_catalog_schema_lock = threading.Lock()
+_catalog_schema_ready = False
+
+def _catalog_connection() -> sqlite3.Connection:
+    """ワーカー間で共有するメタデータカタログへの接続を返す（スレッドごとに1本を使い回す）"""
+    global _catalog_schema_ready
+    conn = getattr(_catalog_local, "conn", None)
+    if conn is not None:
+        return conn
+
+    conn = sqlite3.connect(str(catalog_db_path), timeout=30)
+    # カタログは再抽出できるキャッシュなので、WALモードではコミット毎のfsyncを省く
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # スキーマの作成はプロセスごとに1回だけ行う
+    with _catalog_schema_lock:
+        if not _catalog_schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS images ("
+                    " path TEXT PRIMARY KEY,"
+                    " mtime_ns INTEGER NOT NULL,"
+                    " size INTEGER NOT NULL,"
+                    " metadata TEXT NOT NULL)"
+                )
+            _catalog_schema_ready = True
+    _catalog_local.conn = conn
+    return conn
+
+def get_cached_metadata_many(image_paths: List[Path]) -> Dict[str, Dict]:
+    """複数画像のメタデータをカタログからまとめて取得する（キーは画像パスの文字列）
+
+    カタログに無い、またはファイルが更新されている画像だけを抽出し、1トランザクションで書き戻す。
+    見つからない画像は結果に含めない。
+    """
+    stats = {}
+    for image_path in image_paths:
+        try:
+            stats[str(image_path)] = image_path.stat()
+        except FileNotFoundError:
+            continue
+
+    conn = _catalog_connection()
+    keys = list(stats)
+    results: Dict[str, Dict] = {}
+    for i in range(0, len(keys), CATALOG_QUERY_BATCH_SIZE):
+        batch = keys[i:i + CATALOG_QUERY_BATCH_SIZE]
+        placeholders = ",".join("?" * len(batch))
+        for path, mtime_ns, size, metadata_json in conn.execute(
+            f"SELECT path, mtime_ns, size, metadata FROM images WHERE path IN ({placeholders})",
+            batch,
+        ):
+            stat = stats[path]
+            if mtime_ns == stat.st_mtime_ns and size == stat.st_size:
+                metadata = json.loads(metadata_json)
+                # 移動済みの画像でも現在のパスを返す
+                metadata["image_path"] = path
+                results[path] = metadata
+
+    rows = []
+    for path, stat in stats.items():
+        if path in results:
+            continue
+        metadata = extract_metadata(Path(path))
+        results[path] = metadata
+        rows.append((path, stat.st_mtime_ns, stat.st_size, json.dumps(metadata, ensure_ascii=False, default=str)))
+
+    if rows:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO images (path, mtime_ns, size, metadata) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+    return results
 
-def save_config():
-    with open(config_file_path, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
+def get_cached_metadata(image_path: Path) -> Dict:
+    """カタログにキャッシュされたメタデータを返す。ファイルが更新されていれば再抽出する"""
+    metadata = get_cached_metadata_many([image_path]).get(str(image_path))
+    if metadata is None:
+        raise FileNotFoundError(str(image_path))
+    return metadata
 
-# 初期設定のロード
-load_config()
+def move_image(source_path: Path, target_path: Path):
+    """画像を移動し、カタログのエントリも移動先に付け替える"""
+    shutil.move(str(source_path), str(target_path))
+    conn = _catalog_connection()
+    with conn:
+        conn.execute("DELETE FROM images WHERE path = ?", (str(target_path),))
+        conn.execute(
+            "UPDATE images SET path = ? WHERE path = ?",
+            (str(target_path), str(source_path)),
+        )
+
+def forget_image(image_path: Path):
+    """完全に削除した画像のエントリをカタログから取り除く"""
+    conn = _catalog_connection()
+    with conn:
+        conn.execute("DELETE FROM images WHERE path = ?", (str(image_path),))
 
 def get_unclassified_dir_path() -> Path:
-    path_str = config.get("paths", {}).get("unclassified")
+    path_str = get_config().get("paths", {}).get("unclassified")
     if not path_str:
         # 設定されていない場合、デフォルトのパスを返すかエラー
         # ここでは初回起動設定なので、Noneを返す代わりにエラーを発生させます
@@ -103,7 +288,7 @@ def get_unclassified_dir_path() -> Path:
     return target_path
 
 def get_classified_dir_path(rating: str) -> Path:
-    path_str = config.get("paths", {}).get("classified", {}).get(rating)
+    path_str = get_config().get("paths", {}).get("classified", {}).get(rating)
     if not path_str:
         # 分類済みパスが設定されていない場合は、未分類フォルダの下に作成を試みる
         return get_unclassified_dir_path() / "classified" / rating
@@ -115,7 +300,7 @@ def get_classified_dir_path(rating: str) -> Path:
 
 def get_deleted_dir_path() -> Path:
     """削除済み画像用のディレクトリパスを取得"""
-    path_str = config.get("paths", {}).get("deleted")
+    path_str = get_config().get("paths", {}).get("deleted")
     if not path_str:
         # 設定されていない場合は、未分類フォルダの下に作成
         return get_unclassified_dir_path() / "deleted"
@@ -133,11 +318,47 @@ async def root():
     """ルートエンドポイント"""
     return {"message": "Sikority API is running"}
 
+# カタログのウォームアップ状況（/api/readyで返す）
+catalog_warmup_state = {"ready": False, "warmed": 0, "total": 0, "error": None}
+catalog_warmup_stop = threading.Event()
+
+def warm_up_catalog():
+    """未分類・分類済み画像のメタデータを事前にカタログへ読み込み、初回の一覧取得を速くする"""
+    try:
+        try:
+            image_dirs = [get_unclassified_dir_path()] + [get_classified_dir_path(rating) for rating in ["S", "A", "B", "C", "D"]]
+        except ValueError as e:
+            # 未設定の場合はウォームアップ対象が無いだけなので、準備完了とする
+            print(f"Warning: {e}", file=sys.stderr)
+            catalog_warmup_state["ready"] = True
+            return
+
+        image_paths = [img_path for image_dir in image_dirs for img_path in image_dir.glob("*.png")]
+        catalog_warmup_state["total"] = len(image_paths)
+        # 複数ワーカーが同時に同じ画像を抽出しないよう直列化する（後続のワーカーはキャッシュを読むだけになる）
+        with file_lock("catalog-warmup"):
+            for i in range(0, len(image_paths), CATALOG_QUERY_BATCH_SIZE):
+                if catalog_warmup_stop.is_set():
+                    return
+                batch = image_paths[i:i + CATALOG_QUERY_BATCH_SIZE]
+                get_cached_metadata_many(batch)
+                catalog_warmup_state["warmed"] += len(batch)
+        catalog_warmup_state["ready"] = True
+    except Exception as e:
+        print(f"Error warming up catalog: {e}", file=sys.stderr)
+        catalog_warmup_state["error"] = str(e)
+
+@app.get("/api/ready")
+async def get_ready():
+    """カタログのウォームアップが完了していれば200、未完了または失敗していれば503を返す"""
+    status_code = 200 if catalog_warmup_state["ready"] else 503
+    return JSONResponse(status_code=status_code, content=catalog_warmup_state)
+
 @app.get("/api/status")
 async def get_status():
     unclassified_path_set = False
     unclassified_path_exists = False
-    unclassified_path_str = config.get("paths", {}).get("unclassified")
+    unclassified_path_str = get_config().get("paths", {}).get("unclassified")
     current_unclassified_path = None
 
     if unclassified_path_str:
@@ -156,7 +377,7 @@ async def get_status():
     }
 
 @app.post("/api/setup-unclassified-folder")
-async def setup_unclassified_folder(request: SetupFolderRequest):
+def setup_unclassified_folder(request: SetupFolderRequest):
     folder_path = request.folder_path
     print(f"受信したフォルダパス: {folder_path}")  # デバッグログ
     try:
@@ -167,24 +388,26 @@ async def setup_unclassified_folder(request: SetupFolderRequest):
             print(f"パスが存在しないか、ディレクトリではありません: {new_unclassified_abs_path}")  # デバッグログ
             raise HTTPException(status_code=400, detail=f"指定されたパスはディレクトリではありません、または存在しません: {folder_path}")
         
-        # 設定を更新して保存
-        config["paths"]["unclassified"] = str(new_unclassified_abs_path)
-        save_config()
-        print(f"設定を保存しました: {config['paths']['unclassified']}")  # デバッグログ
-        
+        # 他ワーカーの変更を取り込んだ上で設定を更新して保存
+        with file_lock("config"):
+            new_config = read_config_file()
+            new_config.setdefault("paths", {})["unclassified"] = str(new_unclassified_abs_path)
+            save_config(new_config)
+        print(f"設定を保存しました: {new_config['paths']['unclassified']}")  # デバッグログ
+
         # 分類済みフォルダが存在しない場合は作成
         for rating in ["S", "A", "B", "C", "D"]:
             classified_folder = get_classified_dir_path(rating)
             classified_folder.mkdir(parents=True, exist_ok=True)
             print(f"分類フォルダを作成: {classified_folder}")  # デバッグログ
 
-        return {"message": "未分類フォルダが設定されました。サーバーを再起動してください。"}
+        return {"message": "未分類フォルダが設定されました。"}
     except Exception as e:
         print(f"セットアップエラー: {str(e)}")  # デバッグログ
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/images")
-async def get_images(category: Optional[str] = None) -> List[Dict]:
+def get_images(category: Optional[str] = None) -> List[Dict]:
     """未分類画像と分類済み画像の一覧を取得（フィルター可能）"""
     all_images = []
 
@@ -198,7 +421,8 @@ async def get_images(category: Optional[str] = None) -> List[Dict]:
                 "path": f"/api/serve-image/unclassified/{img_path.name}",
                 "created_at": img_path.stat().st_mtime,
                 "category": "unclassified",
-                "metadata": {}
+                "metadata": {},
+                "_image_path": img_path,
             })
     except ValueError as e:
         print(f"Warning: {e}", file=sys.stderr)
@@ -214,7 +438,8 @@ async def get_images(category: Optional[str] = None) -> List[Dict]:
                     "path": f"/api/serve-image/{rating}/{img_path.name}",
                     "created_at": img_path.stat().st_mtime,
                     "category": rating,
-                    "metadata": {}
+                    "metadata": {},
+                    "_image_path": img_path,
                 })
         except ValueError as e:
             print(f"Warning: {e}", file=sys.stderr)
@@ -229,83 +454,93 @@ async def get_images(category: Optional[str] = None) -> List[Dict]:
                 "path": f"/api/serve-image/deleted/{img_path.name}",
                 "created_at": img_path.stat().st_mtime,
                 "category": "deleted",
-                "metadata": {}
+                "metadata": {},
+                "_image_path": img_path,
             })
     except ValueError as e:
         print(f"Warning: {e}", file=sys.stderr)
 
-    # メタデータの並行取得とフィルタリング
-    results = await asyncio.gather(*[
-        get_image_metadata_safe(img["filename"], img["category"])
-        for img in all_images
-    ])
-    
-    for i, res in enumerate(results):
-        if "error" not in res:
-            all_images[i]["metadata"] = res
-        else:
-            print(f"Error fetching metadata for {all_images[i]["filename"]}: {res["error"]}", file=sys.stderr)
-            all_images[i]["metadata"] = {"error": res["error"]}
-
     # フィルタリング
     if category:
         filtered_images = [img for img in all_images if img["category"].lower() == category.lower()]
     else:
         filtered_images = all_images
+
+    # メタデータはカタログからまとめて取得する（削除済み画像は対象外）
+    image_paths = [img["_image_path"] for img in filtered_images if img["category"] != "deleted"]
+    metadata_by_path = get_cached_metadata_many(image_paths)
+
+    for img in filtered_images:
+        img_path = img.pop("_image_path")
+        if img["category"] == "deleted":
+            res = {"error": "Invalid category for metadata retrieval"}
+        else:
+            res = metadata_by_path.get(str(img_path), {"error": "Image not found"})
+        if "error" not in res:
+            img["metadata"] = res
+        else:
+            print(f"Error fetching metadata for {img['filename']}: {res['error']}", file=sys.stderr)
+            img["metadata"] = {"error": res["error"]}
     
     return sorted(filtered_images, key=lambda x: x["created_at"], reverse=True)
 
 @app.post("/api/classify/{filename}")
-async def classify_image(filename: str, rating: str):
+def classify_image(filename: str, rating: str):
     """画像を分類する（再評価にも対応）"""
     if rating not in ["S", "A", "B", "C", "D"]:
         raise HTTPException(status_code=400, detail="Invalid rating")
     
     try:
-        # 画像を探す（未分類フォルダと分類済みフォルダの両方を確認）
-        source_path = None
-        current_category = None
-        
-        # 未分類フォルダを確認
-        unclassified_path = get_unclassified_dir_path() / filename
-        if unclassified_path.exists():
-            source_path = unclassified_path
-            current_category = "unclassified"
-        
-        # 分類済みフォルダを確認
-        if not source_path:
-            for cat in ["S", "A", "B", "C", "D"]:
-                classified_path = get_classified_dir_path(cat) / filename
-                if classified_path.exists():
-                    source_path = classified_path
-                    current_category = cat
-                    break
-        
-        if not source_path:
-            raise HTTPException(status_code=404, detail="Image not found in any folder")
-        
-        # 同じカテゴリへの再分類は無視
-        if current_category == rating:
-            return {"message": f"Image is already classified as {rating}"}
-        
-        # 移動先のパスを設定
-        target_dir = get_classified_dir_path(rating)
-        target_path = target_dir / filename
-        
-        target_dir.mkdir(parents=True, exist_ok=True)
-        
-        try:
-            shutil.move(str(source_path), str(target_path))
-            return {"message": f"Image classified as {rating}"}
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+        # 他ワーカーと同じ画像を同時に移動しないよう、探索から移動までをロックする
+        with file_lock("images"):
+            # 画像を探す（未分類フォルダと分類済みフォルダの両方を確認）
+            source_path = None
+            current_category = None
+            
+            # 未分類フォルダを確認
+            unclassified_path = get_unclassified_dir_path() / filename
+            if unclassified_path.exists():
+                source_path = unclassified_path
+                current_category = "unclassified"
+            
+            # 分類済みフォルダを確認
+            if not source_path:
+                for cat in ["S", "A", "B", "C", "D"]:
+                    classified_path = get_classified_dir_path(cat) / filename
+                    if classified_path.exists():
+                        source_path = classified_path
+                        current_category = cat
+                        break
+            
+            if not source_path:
+                raise HTTPException(status_code=404, detail="Image not found in any folder")
+            
+            # 同じカテゴリへの再分類は無視
+            if current_category == rating:
+                return {"message": f"Image is already classified as {rating}"}
+            
+            # 移動先のパスを設定
+            target_dir = get_classified_dir_path(rating)
+            target_path = target_dir / filename
+            
+            target_dir.mkdir(parents=True, exist_ok=True)
+            
+            try:
+                move_image(source_path, target_path)
+                return {"message": f"Image classified as {rating}"}
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
             
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/api/images/{filename}")
-async def delete_image(filename: str, category: str = "unclassified"):
+def delete_image(filename: str, category: str = "unclassified"):
     """画像を削除済みフォルダに移動する"""
+    with file_lock("images"):
+        return _delete_image_locked(filename, category)
+
+def _delete_image_locked(filename: str, category: str):
     source_path: Path
     try:
         if category.lower() == "unclassified":
@@ -321,6 +556,7 @@ async def delete_image(filename: str, category: str = "unclassified"):
                 raise HTTPException(status_code=404, detail="Image not found in deleted folder")
             try:
                 os.remove(source_path)
+                forget_image(source_path)
                 return {"message": "Image permanently deleted"}
             except Exception as e:
                 raise HTTPException(status_code=500, detail=str(e))
@@ -352,7 +588,7 @@ async def delete_image(filename: str, category: str = "unclassified"):
                 'deleted_at': int(time.time())
             }, f, ensure_ascii=False)
         
-        shutil.move(str(source_path), str(target_path))
+        move_image(source_path, target_path)
         return {"message": "Image moved to deleted folder"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -371,6 +607,8 @@ async def get_models():
 @app.post("/api/generate-image")
 async def generate_image(request: GenerateImageRequest):
     """Stable Diffusionで画像を生成し、保存する"""
+    import requests
+
     # モデルが指定されている場合、選択されたモデルのパスをペイロードに含める
     selected_model_path: Optional[str] = None
     if request.model_id:
@@ -381,6 +619,7 @@ async def generate_image(request: GenerateImageRequest):
         selected_model_path = selected_model.path
 
     # Automatic1111のtxt2imgエンドポイントURL
+    config = get_config()
     sd_api_url = f"{config['api']['automatic1111']['base_url']}{config['api']['automatic1111']['endpoints']['txt2img']}"
     
     payload = {
@@ -421,10 +660,11 @@ async def generate_image(request: GenerateImageRequest):
 
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        filename = f"generated_{int(time.time())}.png"
+        # 複数ワーカーが同時に生成しても上書きしないよう、一意な名前で新規作成する
+        filename = f"generated_{time.time_ns()}_{uuid.uuid4().hex[:8]}.png"
         image_path = output_dir / filename
         
-        with open(image_path, "wb") as f:
+        with open(image_path, "xb") as f:
             f.write(img_data)
             
         return {"filename": filename, "path": f"/api/serve-image/unclassified/{filename}", "category": "unclassified"}
@@ -436,31 +676,8 @@ async def generate_image(request: GenerateImageRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"画像生成中にエラーが発生しました: {e}")
 
-async def get_image_metadata_safe(filename: str, category: str): 
-    image_path: Path
-    try:
-        if category.lower() == "unclassified":
-            image_path = get_unclassified_dir_path() / filename
-        elif category.upper() in ["S", "A", "B", "C", "D"]:
-            image_path = get_classified_dir_path(category.upper()) / filename
-        else:
-            return {"error": "Invalid category for metadata retrieval"}
-    except ValueError as e:
-        return {"error": str(e)}
-    
-    if not image_path.exists():
-        return {"error": "Image not found"}
-    
-    try:
-        # subprocessの代わりに直接extract_metadataを呼び出す
-        metadata = extract_metadata(image_path)
-        return metadata
-    except Exception as e:
-        # extract_metadata内でエラーがプリントされるため、ここでは詳細を省略
-        return {"error": f"Failed to extract metadata: {e}"}
-
 @app.get("/api/images/{filename}/metadata") # 既存のメタデータAPIは残す（不要なら削除）
-async def get_image_metadata(filename: str):
+def get_image_metadata(filename: str):
     # このエンドポイントは未使用になるが、残しておいても良い。
     # フロントエンドは直接このAPIを呼ばず、get_imagesからメタデータを取得する
     # カテゴリ指定なしでunclassifiedから探す
@@ -486,7 +703,7 @@ async def get_image_metadata(filename: str):
             return {"error": "Image not found"}
     
     try:
-        metadata = extract_metadata(image_path) # 直接呼び出し
+        metadata = get_cached_metadata(image_path)
         return metadata
     except Exception as e:
         print(f"Failed to process metadata for {filename}: {e}", file=sys.stderr)
@@ -512,9 +729,197 @@ async def serve_image(image_type: str, filename: str):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# エクスポート時にファイルを読み込むチャンクサイズ
+EXPORT_CHUNK_SIZE = 1024 * 1024
+
+class _StreamBuffer:
+    """書き込まれたバイト列を溜めておき、ストリーミングレスポンスへ順次渡すための書き込み先"""
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
+        return data
+
+def _iter_manifest_lines(image_paths: List[Path]):
+    """エクスポートした画像のメタデータをJSONLの1行ずつ生成する（カタログはまとめて引く）"""
+    for i in range(0, len(image_paths), CATALOG_QUERY_BATCH_SIZE):
+        batch = image_paths[i:i + CATALOG_QUERY_BATCH_SIZE]
+        try:
+            metadata_by_path = get_cached_metadata_many(batch)
+        except Exception as e:
+            print(f"Error fetching metadata for manifest: {e}", file=sys.stderr)
+            metadata_by_path = {}
+        for image_path in batch:
+            metadata = metadata_by_path.get(str(image_path))
+            if metadata is None:
+                metadata = {"image_path": str(image_path), "error": "Failed to extract metadata"}
+            line = json.dumps({"filename": image_path.name, **metadata}, ensure_ascii=False, default=str)
+            yield (line + "\n").encode("utf-8")
+
+def _iter_zip(image_paths: List[Path], include_manifest: bool):
+    """画像を無圧縮のZIPとして逐次生成する（PNGは再圧縮しない）"""
+    buffer = _StreamBuffer()
+    written: List[Path] = []
+    # シーク不可の書き込み先を渡すと、zipfileはデータディスクリプタ付きで逐次書き出す
+    # 1980年より前の更新時刻はZIPで表せないため、例外にせず1980年に丸める
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED, strict_timestamps=False) as zf:
+        for image_path in image_paths:
+            try:
+                info = zipfile.ZipInfo.from_file(image_path, image_path.name, strict_timestamps=False)
+                with open(image_path, "rb") as src, zf.open(info, "w") as dst:
+                    while chunk := src.read(EXPORT_CHUNK_SIZE):
+                        dst.write(chunk)
+                        yield buffer.drain()
+            except FileNotFoundError:
+                # エクスポート中に他のリクエストで移動された画像はスキップする
+                print(f"Warning: {image_path} was moved during export", file=sys.stderr)
+                continue
+            except OSError as e:
+                # 読めない画像もスキップし、アーカイブ自体は最後まで書き上げる
+                print(f"Warning: skipping {image_path} in export: {e}", file=sys.stderr)
+                yield buffer.drain()
+                continue
+            written.append(image_path)
+            yield buffer.drain()
+        if include_manifest:
+            info = zipfile.ZipInfo("manifest.jsonl", date_time=time.localtime()[:6])
+            with zf.open(info, "w") as dst:
+                for line in _iter_manifest_lines(written):
+                    dst.write(line)
+                    if buffer.size >= EXPORT_CHUNK_SIZE:
+                        yield buffer.drain()
+    yield buffer.drain()
+
+def _iter_tar(image_paths: List[Path], include_manifest: bool):
+    """画像をTARとして逐次生成する。ヘッダーを自前で書き、ファイル本体はチャンク単位で流す"""
+    def padding(size: int) -> bytes:
+        remainder = size % tarfile.BLOCKSIZE
+        return b"\0" * (tarfile.BLOCKSIZE - remainder) if remainder else b""
+
+    written: List[Path] = []
+    for image_path in image_paths:
+        try:
+            src = open(image_path, "rb")
+        except FileNotFoundError:
+            print(f"Warning: {image_path} was moved during export", file=sys.stderr)
+            continue
+        except OSError as e:
+            print(f"Warning: skipping {image_path} in export: {e}", file=sys.stderr)
+            continue
+
+        with src:
+            stat = os.fstat(src.fileno())
+            info = tarfile.TarInfo(image_path.name)
+            info.size = stat.st_size
+            info.mtime = int(stat.st_mtime)
+            yield info.tobuf(format=tarfile.PAX_FORMAT)
+
+            # ヘッダー送信後にファイルが伸び縮みしても、ヘッダーのサイズちょうどを送る
+            remaining = stat.st_size
+            try:
+                while remaining and (chunk := src.read(min(EXPORT_CHUNK_SIZE, remaining))):
+                    remaining -= len(chunk)
+                    yield chunk
+            except OSError as e:
+                print(f"Warning: failed to read {image_path} during export: {e}", file=sys.stderr)
+            if remaining:
+                print(f"Warning: {image_path} shrank during export, padding with zeros", file=sys.stderr)
+                while remaining:
+                    size = min(EXPORT_CHUNK_SIZE, remaining)
+                    remaining -= size
+                    yield b"\0" * size
+            yield padding(stat.st_size)
+        written.append(image_path)
+
+    if include_manifest:
+        # TARヘッダーにはサイズが必要なため、先にカタログから行の長さだけを合計する
+        manifest_size = sum(len(line) for line in _iter_manifest_lines(written))
+        info = tarfile.TarInfo("manifest.jsonl")
+        info.size = manifest_size
+        info.mtime = int(time.time())
+        yield info.tobuf(format=tarfile.PAX_FORMAT)
+
+        remaining = manifest_size
+        for line in _iter_manifest_lines(written):
+            # 2回の走査の間に画像が更新され行の長さが変わっても、ヘッダーのサイズは守る
+            line = line[:remaining]
+            remaining -= len(line)
+            yield line
+        if remaining:
+            print("Warning: manifest changed during export", file=sys.stderr)
+            yield b"\n" * remaining
+        yield padding(manifest_size)
+
+    # アーカイブ終端（ゼロブロック2つ）
+    yield b"\0" * (tarfile.BLOCKSIZE * 2)
+
+@app.get("/api/export/{image_type}")
+def export_images(
+    image_type: str,
+    format: str = "zip",
+    manifest: bool = False,
+    filenames: Optional[List[str]] = Query(None),
+):
+    """カテゴリ内の画像（またはその一部）をZIP/TARとしてストリーミングで一括ダウンロードする"""
+    if format not in ["zip", "tar"]:
+        raise HTTPException(status_code=400, detail="Invalid export format")
+
+    try:
+        if image_type == "unclassified":
+            image_dir = get_unclassified_dir_path()
+        elif image_type in ["S", "A", "B", "C", "D"]:
+            image_dir = get_classified_dir_path(image_type)
+        elif image_type == "deleted":
+            image_dir = get_deleted_dir_path()
+        else:
+            raise HTTPException(status_code=400, detail="Invalid image type")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if filenames:
+        if any(Path(name).name != name or not name.lower().endswith(".png") for name in filenames):
+            raise HTTPException(status_code=400, detail="Invalid filename")
+        # 同じ画像が重複して格納されないよう、順序を保ったまま重複を除く
+        image_paths = [image_dir / name for name in dict.fromkeys(filenames) if (image_dir / name).is_file()]
+    else:
+        image_paths = sorted(image_dir.glob("*.png"))
+
+    if not image_paths:
+        raise HTTPException(status_code=404, detail="No images to export")
+
+    archive_name = f"sikority_{image_type}_{int(time.time())}.{format}"
+    if format == "zip":
+        content = _iter_zip(image_paths, manifest)
+        media_type = "application/zip"
+    else:
+        content = _iter_tar(image_paths, manifest)
+        media_type = "application/x-tar"
+
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{archive_name}"'},
+    )
+
 @app.post("/api/restore/{filename}")
-async def restore_image(filename: str):
+def restore_image(filename: str):
     """削除済み画像を元のフォルダに復元する"""
+    with file_lock("images"):
+        return _restore_image_locked(filename)
+
+def _restore_image_locked(filename: str):
     try:
         source_path = get_deleted_dir_path() / filename
         if not source_path.exists():
@@ -547,7 +952,7 @@ async def restore_image(filename: str):
             target_path = target_dir / f"{name}_{timestamp}.{ext}"
         
         # 画像を移動
-        shutil.move(str(source_path), str(target_path))
+        move_image(source_path, target_path)
         
         # メタデータファイルを削除
         if metadata_path.exists():
@@ -563,8 +968,12 @@ async def restore_image(filename: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/deleted")
-async def delete_all_deleted():
+def delete_all_deleted():
     """削除済みフォルダ内の全画像を完全に削除する"""
+    with file_lock("images"):
+        return _delete_all_deleted_locked()
+
+def _delete_all_deleted_locked():
     try:
         deleted_dir = get_deleted_dir_path()
         if not deleted_dir.exists():
@@ -574,6 +983,7 @@ async def delete_all_deleted():
         for img_path in deleted_dir.glob("*.png"):
             try:
                 os.remove(img_path)
+                forget_image(img_path)
             except Exception as e:
                 print(f"Error deleting {img_path}: {e}", file=sys.stderr)
                 continue
@@ -656,5 +1066,8 @@ def get_available_models() -> List[Model]:
 
 if __name__ == "__main__":
     import uvicorn
-    print(f"サーバー起動: http://{config['server']['host']}:{config['server']['port']}")
-    uvicorn.run(app, host=config["server"]["host"], port=config["server"]["port"]) 
\ No newline at end of file
+    config = get_config()
+    workers = config["server"].get("workers", 1)
+    print(f"サーバー起動: http://{config['server']['host']}:{config['server']['port']} (workers: {workers})")
+    # 複数ワーカーで起動する場合はアプリをインポート文字列で渡す必要がある
+    uvicorn.run("main:app", host=config["server"]["host"], port=config["server"]["port"], workers=workers)
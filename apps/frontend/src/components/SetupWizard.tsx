@@ -31,8 +31,9 @@ const SetupWizard: React.FC<SetupWizardProps> = ({ onSetupComplete }) => {
         const errorData = await response.json()
         throw new Error(errorData.detail || 'フォルダ設定に失敗しました')
       }
-      setMessage('フォルダが正常に設定されました。サーバーを再起動してください。')
-      // onSetupComplete(); // サーバー再起動が必要なため、自動リロードはしない
+      setMessage('フォルダが正常に設定されました。')
+      // 設定は全ワーカーに即時反映されるため、再起動せずにそのまま一覧を読み込む
+      onSetupComplete()
     } catch (err: any) {
       setError(err.message)
       console.error('フォルダ設定エラー:', err)
@@ -77,9 +78,6 @@ const SetupWizard: React.FC<SetupWizardProps> = ({ onSetupComplete }) => {
             {loading ? '設定中...' : 'フォルダを設定'}
           </Button>
         </form>
-        <p className="text-sm text-gray-500 mt-4 text-center">
-          ※ フォルダ設定後、バックエンドサーバーを再起動してください。
-        </p>
       </div>
     </div>
   )